@@ -1,12 +1,15 @@
 #!/usr/bin/env python3
 import sys
-import re
 
 # Usage:
 # python3 py_utils/format_sorted_strings.py "bit_length char_length length"
 # python3 py_utils/format_sorted_strings.py "var_pop" "var_samp" "variance"
 # python3 py_utils/format_sorted_strings.py var_pop,var_samp,variance
 
+# Quotes are dropped and commas become whitespace, so a single str.split()
+# tokenizes the whole input.
+_TRANS = str.maketrans({'"': None, "'": None, ',': ' '})
+
 def main() -> int:
     # Check if we have command-line arguments (excluding script name)
     if len(sys.argv) > 1:
@@ -23,27 +26,20 @@ def main() -> int:
             return 1
         data = sys.stdin.read()
     
-    # Remove all quotes (both single and double)
-    data = data.replace('"', '').replace("'", '')
-    
-    # Split by commas, whitespace, or newlines
-    items = re.split(r'[,\s]+', data)
-    
-    # Filter out empty strings
-    items = [s.strip() for s in items if s.strip()]
+    # Remove all quotes and split by commas, whitespace, or newlines
+    items = data.translate(_TRANS).split()
     
     if not items:
         print("Error: No valid items found in input.", file=sys.stderr)
         return 1
     
-    # Remove duplicates and sort
-    items = sorted(set(items))
+    # Remove duplicates and sort. dict.fromkeys keeps input order, so already
+    # sorted pastes hit Timsort's presorted-run fast path.
+    items = sorted(dict.fromkeys(items))
     
-    print("{")
-    for i, s in enumerate(items):
-        comma = "," if i + 1 < len(items) else ""
-        print(f'  "{s}"{comma}')
-    print("}")
+    # Build the whole block up front so it goes out in a single write.
+    body = ",\n".join(f'  "{s}"' for s in items)
+    sys.stdout.write("{\n" + body + "\n}\n")
     
     return 0
 
@@ -1,24 +1,134 @@
 #!/usr/bin/env python3
 """
-Runs the local libpg_query-based AST dumper and prints the JSON parse tree.
+Runs the local libpg_query-based AST dumper and prints the JSON parse tree,
+pretty-printed on a terminal and compact when piped.
 Usage:
   echo "SELECT 1" | py_utils/pg_dump_ast.py
   py_utils/pg_dump_ast.py "SELECT 1"
 """
+import ctypes
 import os
-import json
 import subprocess
 import sys
 
+# orjson is optional: it parses bytes directly and is much faster on large
+# parse trees. The stdlib fallback keeps the script dependency-free.
+try:
+    import orjson
+
+    def _loads(raw):
+        return orjson.loads(raw)
+
+    def _dumps_pretty(obj):
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+
+except ImportError:
+    import json
+
+    def _loads(raw):
+        return json.loads(raw)
+
+    def _dumps_pretty(obj):
+        return json.dumps(obj, indent=2, ensure_ascii=False).encode("utf-8")
+
+
+# Optional shared build of the vendored libpg_query
+# (`make -C third_party/libpg_query build_shared`). When it is present we
+# parse in-process and skip the fork+exec of build/pg_dump_ast.
+LIBPG_QUERY_SO = os.path.join("third_party", "libpg_query", "libpg_query.so")
+
+
+# Mirrors PgQueryError from pg_query.h.
+class _PgQueryError(ctypes.Structure):
+    _fields_ = [
+        ("message", ctypes.c_char_p),
+        ("funcname", ctypes.c_char_p),
+        ("filename", ctypes.c_char_p),
+        ("lineno", ctypes.c_int),
+        ("cursorpos", ctypes.c_int),
+        ("context", ctypes.c_char_p),
+    ]
+
+
+# Mirrors PgQueryParseResult from pg_query.h.
+class _PgQueryParseResult(ctypes.Structure):
+    _fields_ = [
+        ("parse_tree", ctypes.c_char_p),
+        ("stderr_buffer", ctypes.c_char_p),
+        ("error", ctypes.POINTER(_PgQueryError)),
+    ]
+
+
+# Loads the shared libpg_query, or returns None when it is not built or cannot
+# be loaded so the caller falls back to the dumper binary.
+def _load_libpg_query(repo_root):
+    path = os.path.join(repo_root, LIBPG_QUERY_SO)
+    if not os.path.exists(path):
+        return None
+    try:
+        lib = ctypes.CDLL(path)
+    except OSError:
+        return None
+    lib.pg_query_parse.argtypes = [ctypes.c_char_p]
+    lib.pg_query_parse.restype = _PgQueryParseResult
+    lib.pg_query_free_parse_result.argtypes = [_PgQueryParseResult]
+    lib.pg_query_free_parse_result.restype = None
+    return lib
+
+
+# Parses 'sql' in-process. Returns (returncode, stdout bytes) with the same
+# conventions and error message as build/pg_dump_ast.
+def _parse_in_process(lib, sql):
+    result = lib.pg_query_parse(sql)
+    try:
+        if result.error:
+            err = result.error.contents
+            msg = (err.message or b"").decode("utf-8", errors="replace")
+            sys.stderr.write(f"error: {msg} at {err.cursorpos}\n")
+            return 1, b""
+        # c_char_p fields are copied out as bytes, so they stay valid after
+        # the result is freed.
+        tree = result.parse_tree
+        return 0, (tree + b"\n") if tree is not None else b""
+    finally:
+        lib.pg_query_free_parse_result(result)
+
+
+# Runs build/pg_dump_ast on 'sql'. Returns (returncode, stdout bytes).
+def _parse_with_dumper(bin_path, sql):
+    if not hasattr(os, "memfd_create"):
+        proc = subprocess.run(
+            [bin_path],
+            input=sql,
+            stdout=subprocess.PIPE,
+            stderr=sys.stderr,
+            check=False,
+        )
+        return proc.returncode, proc.stdout
+
+    # Hand the child an in-memory file as stdin instead of pumping 'sql'
+    # through a pipe: the child reads it at its own pace and we only have to
+    # drain its stdout.
+    fd = os.memfd_create("pg_dump_ast_sql", os.MFD_CLOEXEC)
+    try:
+        view = memoryview(sql)
+        while view:
+            view = view[os.write(fd, view) :]
+        os.lseek(fd, 0, os.SEEK_SET)
+        proc = subprocess.run(
+            [bin_path],
+            stdin=fd,
+            stdout=subprocess.PIPE,
+            stderr=sys.stderr,
+            check=False,
+        )
+    finally:
+        os.close(fd)
+    return proc.returncode, proc.stdout
+
 
 def main() -> int:
     repo_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
-    bin_path = os.path.join(repo_root, "build", "pg_dump_ast")
-    if not os.path.exists(bin_path):
-        sys.stderr.write(
-            "error: build/pg_dump_ast not found. Run `make pg-dump-ast` first.\n"
-        )
-        return 2
 
     if len(sys.argv) > 1:
         sql = " ".join(sys.argv[1:]).encode("utf-8")
@@ -29,26 +139,34 @@ def main() -> int:
         sys.stderr.write("error: no SQL provided (use stdin or args)\n")
         return 2
 
-    proc = subprocess.run(
-        [bin_path],
-        input=sql,
-        stdout=subprocess.PIPE,
-        stderr=sys.stderr,
-        check=False,
-    )
-    if proc.returncode != 0:
-        sys.stdout.buffer.write(proc.stdout)
-        return proc.returncode
-
-    raw = proc.stdout.decode("utf-8", errors="replace")
+    lib = _load_libpg_query(repo_root)
+    if lib is not None:
+        rc, out = _parse_in_process(lib, sql)
+    else:
+        bin_path = os.path.join(repo_root, "build", "pg_dump_ast")
+        if not os.path.exists(bin_path):
+            sys.stderr.write(
+                "error: build/pg_dump_ast not found. Run `make pg-dump-ast` first.\n"
+            )
+            return 2
+        rc, out = _parse_with_dumper(bin_path, sql)
+
+    # Pipes (jq, diff, ...) get the dumper's compact JSON verbatim; only a
+    # terminal gets the parse + re-indent pass. 'out' already ends in "\n".
+    if rc != 0 or not sys.stdout.isatty():
+        sys.stdout.buffer.write(out)
+        return rc
+
+    # Both decoders accept bytes, so there is no separate UTF-8 decode pass.
+    # Decode and JSON errors are ValueError subclasses in both libraries.
     try:
-        obj = json.loads(raw)
-    except json.JSONDecodeError:
-        sys.stdout.write(raw)
+        obj = _loads(out)
+    except ValueError:
+        sys.stdout.buffer.write(out)
         return 0
 
-    sys.stdout.write(json.dumps(obj, indent=2, ensure_ascii=False))
-    sys.stdout.write("\n")
+    sys.stdout.buffer.write(_dumps_pretty(obj))
+    sys.stdout.buffer.write(b"\n")
     return 0
 
 
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
-import json
+import functools
 import os
+import select
 import socket
 import struct
 import shutil
@@ -9,7 +10,11 @@ import time
 
 from test_user_mcp_handshake import (
     MCP_PROTOCOL_VERSION,
+    assert_rpc_response,
+    broker_sock_path,
     do_user_handshake,
+    dumps,
+    loads,
     make_runtime_dir,
     make_temp_privdir,
     privdir_app_dir,
@@ -17,7 +22,10 @@ from test_user_mcp_handshake import (
     start_broker,
     start_server,
     read_frame,
+    run_on_shared_broker,
+    run_tests,
     stop_proc,
+    stop_procs,
     write_frame,
 )
 
@@ -28,16 +36,30 @@ HANDSHAKE_MAGIC = 0x4D435042
 HANDSHAKE_VERSION = 1
 HANDSHAKE_REQ_WIRE_SIZE = 4 + 2 + 2 + RESUME_TOKEN_LEN + SECRET_TOKEN_LEN
 HANDSHAKE_RESP_WIRE_SIZE = 4 + 2 + 2 + RESUME_TOKEN_LEN + 4 + 4
+# Idle TTL override (ADBX_TEST_IDLE_TTL_SEC) for the expiry test.
+TEST_IDLE_TTL_SEC = 1
 
+# Precompiled wire layouts; all scalar fields are big-endian.
+_HS_REQ = struct.Struct(">IHH32s32s")  # magic, version, flags, resume, secret
+_HS_HDR = struct.Struct(">IHH")  # magic, version, status
+_U32 = struct.Struct(">I")  # frame length prefix
 
-# Linux /proc stat field #22 (starttime) extraction.
+# Linux-only: wakes poll() as soon as the peer shuts down its write side.
+_POLLRDHUP = getattr(select, "POLLRDHUP", 0)
+
+
+# Linux /proc stat field #22 (starttime) extraction. Start ticks never change
+# for a live pid, so the result is cached.
+@functools.lru_cache(maxsize=8)
 def _proc_start_ticks(pid):
     with open(f"/proc/{pid}/stat", "r", encoding="utf-8") as f:
         line = f.read().strip()
     rparen = line.rfind(")")
     if rparen <= 0:
         raise RuntimeError("unexpected /proc stat format")
-    fields_after_comm = line[rparen + 2 :].split()
+    # Stop splitting right after starttime (index 19) instead of tokenizing
+    # the remaining ~30 fields.
+    fields_after_comm = line[rparen + 2 :].split(None, 20)
     if len(fields_after_comm) < 20:
         raise RuntimeError("unexpected /proc stat fields")
     return int(fields_after_comm[19])
@@ -47,11 +69,67 @@ def _resume_store_dir(runtime_dir):
     return os.path.join(runtime_dir, RESTOK_DIR_NAME)
 
 
-def _resume_token_path(runtime_dir):
+def _resume_token_name():
     # resume_token.c scopes token filename by parent pid + parent start ticks.
     pid = os.getpid()
     ticks = _proc_start_ticks(pid)
-    return os.path.join(_resume_store_dir(runtime_dir), f"token-{pid}-{ticks}")
+    return f"token-{pid}-{ticks}"
+
+
+def _resume_token_path(runtime_dir):
+    return os.path.join(_resume_store_dir(runtime_dir), _resume_token_name())
+
+
+def _unlink_if_exists(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def _rmdir_if_exists(path):
+    try:
+        os.rmdir(path)
+    except FileNotFoundError:
+        pass
+
+
+# Removes a test privdir by unlinking the entries broker and tests create,
+# which skips rmtree's walk and per-entry lstat. Falls back to rmtree when
+# something unexpected was left behind (rmdir on a non-empty dir fails).
+def _cleanup_privdir(privdir):
+    app_dir = privdir_app_dir(privdir)
+    try:
+        _unlink_if_exists(broker_sock_path(privdir))
+        _unlink_if_exists(secret_token_path(privdir))
+        _rmdir_if_exists(os.path.join(app_dir, "run"))
+        _rmdir_if_exists(os.path.join(app_dir, "secret"))
+        _rmdir_if_exists(app_dir)
+        _rmdir_if_exists(privdir)
+    except OSError:
+        shutil.rmtree(privdir, ignore_errors=True)
+
+
+# Same as _cleanup_privdir for a runtime dir holding at most our resume token.
+def _cleanup_runtime_dir(runtime_dir):
+    try:
+        _unlink_if_exists(_resume_token_path(runtime_dir))
+        _rmdir_if_exists(_resume_store_dir(runtime_dir))
+        _rmdir_if_exists(runtime_dir)
+    except OSError:
+        shutil.rmtree(runtime_dir, ignore_errors=True)
+
+
+# Writes 'token' with a single open: mode 0600 is applied at creation instead
+# of by a separate chmod, and O_NOFOLLOW refuses a symlinked final component.
+# Test-only files, so no fsync.
+def _write_token_file(path, token, dir_fd=None):
+    flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_NOFOLLOW
+    fd = os.open(path, flags, 0o600, dir_fd=dir_fd)
+    try:
+        os.write(fd, token)
+    finally:
+        os.close(fd)
 
 
 def _seed_resume_token_file(runtime_dir, token):
@@ -62,19 +140,30 @@ def _seed_resume_token_file(runtime_dir, token):
     os.makedirs(store_dir, mode=0o700, exist_ok=True)
     os.chmod(store_dir, 0o700)
 
-    token_path = _resume_token_path(runtime_dir)
-    with open(token_path, "wb") as f:
-        f.write(token)
-    os.chmod(token_path, 0o600)
-    return token_path
+    # Resolve the store dir once and open the token relative to it.
+    name = _resume_token_name()
+    dfd = os.open(store_dir, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        _write_token_file(name, token, dir_fd=dfd)
+    finally:
+        os.close(dfd)
+    return os.path.join(store_dir, name)
 
 
 def _read_resume_token_file(runtime_dir):
-    token_path = _resume_token_path(runtime_dir)
-    if not os.path.exists(token_path):
+    try:
+        dfd = os.open(_resume_store_dir(runtime_dir), os.O_RDONLY | os.O_DIRECTORY)
+    except FileNotFoundError:
         return None
-    with open(token_path, "rb") as f:
-        return f.read()
+    try:
+        try:
+            fd = os.open(_resume_token_name(), os.O_RDONLY, dir_fd=dfd)
+        except FileNotFoundError:
+            return None
+        with os.fdopen(fd, "rb") as f:
+            return f.read()
+    finally:
+        os.close(dfd)
 
 
 def _prepare_privdir_for_server_start(privdir, token):
@@ -91,10 +180,7 @@ def _prepare_privdir_for_server_start(privdir, token):
     os.chmod(run_dir, 0o700)
     os.chmod(sec_dir, 0o700)
 
-    tok_path = secret_token_path(privdir)
-    with open(tok_path, "wb") as f:
-        f.write(token)
-    os.chmod(tok_path, 0o600)
+    _write_token_file(secret_token_path(privdir), token)
 
 
 def _wait_start_failure(proc, timeout_sec=3.0):
@@ -117,13 +203,12 @@ def _do_tools_call(server, req_id, connection_name="MyPostgres", query="SELECT 1
             },
         },
     }
-    write_frame(server, json.dumps(req).encode("utf-8"))
-    return json.loads(read_frame(server).decode("utf-8"))
+    write_frame(server, dumps(req))
+    return loads(read_frame(server))
 
 
 def _assert_broker_unavailable_error(resp, req_id):
-    assert resp["jsonrpc"] == "2.0"
-    assert resp["id"] == req_id
+    assert_rpc_response(resp, req_id)
     assert "error" in resp
     msg = str(resp["error"].get("message", ""))
     assert "Unable to reach broker" in msg
@@ -147,7 +232,7 @@ def _assert_broker_usable(privdir):
         _send_len_prefixed(client, len(req), req)
         payload = _read_len_prefixed(client, timeout_sec=6.0)
         assert len(payload) == HANDSHAKE_RESP_WIRE_SIZE
-        magic, version, status = struct.unpack(">IHH", payload[:8])
+        magic, version, status = _HS_HDR.unpack_from(payload)
         assert magic == HANDSHAKE_MAGIC
         assert version == HANDSHAKE_VERSION
         assert status == 0  # HS_OK
@@ -165,9 +250,7 @@ def _read_broker_secret_token(privdir):
 
 def _build_handshake_req_bytes(secret_token, magic=HANDSHAKE_MAGIC):
     assert len(secret_token) == SECRET_TOKEN_LEN
-    # Wire scalar fields are big-endian.
-    req = struct.pack(
-        ">IHH32s32s",
+    req = _HS_REQ.pack(
         magic,
         HANDSHAKE_VERSION,
         0,
@@ -178,23 +261,20 @@ def _build_handshake_req_bytes(secret_token, magic=HANDSHAKE_MAGIC):
     return req
 
 
-def _write_all(sock, data):
-    view = memoryview(data)
-    while view:
-        sent = sock.send(view)
-        if sent <= 0:
-            raise RuntimeError("socket write failed")
-        view = view[sent:]
-
-
 def _send_len_prefixed(sock, declared_len, payload):
     if declared_len < 0 or declared_len > 0xFFFFFFFF:
         raise ValueError("declared_len must fit uint32")
     if len(payload) > declared_len:
         raise ValueError("payload cannot exceed declared length")
-    _write_all(sock, struct.pack(">I", declared_len))
-    if payload:
-        _write_all(sock, payload)
+    hdr = _U32.pack(declared_len)
+    if not hasattr(sock, "sendmsg"):
+        sock.sendall(hdr + payload)
+        return
+    # Scatter-gather keeps header and payload in one syscall without copying
+    # them into a joined buffer. sendmsg may write short, so finish the tail.
+    sent = sock.sendmsg([hdr, payload])
+    if sent < len(hdr) + len(payload):
+        sock.sendall((hdr + payload)[sent:])
 
 
 def _connect_raw_broker_client(privdir):
@@ -204,16 +284,17 @@ def _connect_raw_broker_client(privdir):
     return client
 
 
+# Waits for the broker to close 'client'. The broker may send a handshake
+# error response before closing, so readable data is drained until EOF.
 def _wait_broker_close(client, timeout_sec=6.0):
-    client.settimeout(timeout_sec)
-    deadline = time.time() + timeout_sec
+    poller = select.poll()
+    poller.register(client, select.POLLIN | _POLLRDHUP)
+    deadline = time.monotonic() + timeout_sec
     while True:
-        remaining = deadline - time.time()
-        if remaining <= 0:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or not poller.poll(remaining * 1000):
             raise AssertionError("broker did not close malformed client in time")
-        client.settimeout(remaining)
-        chunk = client.recv(4096)
-        if chunk == b"":
+        if client.recv(4096) == b"":
             return
 
 
@@ -221,34 +302,34 @@ def _recv_exact(client, n, timeout_sec=6.0):
     if n < 0:
         raise ValueError("n must be >= 0")
     client.settimeout(timeout_sec)
-    data = bytearray()
-    while len(data) < n:
-        chunk = client.recv(n - len(data))
-        if chunk == b"":
+    # The frame size is known up front: fill one buffer in place rather than
+    # growing it chunk by chunk.
+    buf = bytearray(n)
+    view = memoryview(buf)
+    got = 0
+    while got < n:
+        r = client.recv_into(view[got:], n - got)
+        if r == 0:
             raise AssertionError("unexpected EOF while reading broker frame")
-        data.extend(chunk)
-    return bytes(data)
+        got += r
+    return bytes(buf)
 
 
 def _read_len_prefixed(client, timeout_sec=6.0):
     hdr = _recv_exact(client, 4, timeout_sec=timeout_sec)
-    declared = struct.unpack(">I", hdr)[0]
+    (declared,) = _U32.unpack(hdr)
     return _recv_exact(client, declared, timeout_sec=timeout_sec)
 
 
-def do_full_handshake(
+# Starts an MCP server against the broker already serving privdir and runs the
+# initialize handshake. Returns (server, runtime_dir, resp).
+def start_session(
+    privdir,
     req_id=1,
     protocol_version=MCP_PROTOCOL_VERSION,
-    privdir=None,
-    broker_env=None,
     server_env=None,
 ):
-    created_privdir = False
     created_runtime = False
-    if privdir is None:
-        privdir = make_temp_privdir("full-hs")
-        created_privdir = True
-
     merged_server_env = dict(server_env or {})
     runtime_dir = merged_server_env.get("XDG_RUNTIME_DIR")
     if not runtime_dir:
@@ -256,20 +337,15 @@ def do_full_handshake(
         merged_server_env["XDG_RUNTIME_DIR"] = runtime_dir
         created_runtime = True
 
-    broker = None
     server = None
     try:
-        broker = start_broker(privdir, env=broker_env)
         server = start_server(privdir, env=merged_server_env)
         resp = do_user_handshake(server, req_id, protocol_version)
-        return broker, server, privdir, runtime_dir, resp
+        return server, runtime_dir, resp
     except Exception:
         stop_proc(server)
-        stop_proc(broker)
-        if created_privdir:
-            shutil.rmtree(privdir, ignore_errors=True)
         if created_runtime:
-            shutil.rmtree(runtime_dir, ignore_errors=True)
+            _cleanup_runtime_dir(runtime_dir)
         raise
 
 
@@ -287,8 +363,8 @@ def test_broker_absent_server_reports_unavailable_on_tools_call():
         _assert_broker_unavailable_error(call, "no-broker-tool")
     finally:
         stop_proc(server)
-        shutil.rmtree(runtime_dir, ignore_errors=True)
-        shutil.rmtree(privdir, ignore_errors=True)
+        _cleanup_runtime_dir(runtime_dir)
+        _cleanup_privdir(privdir)
 
 
 def test_secret_token_mismatch_reports_unavailable_then_recovers():
@@ -304,9 +380,7 @@ def test_secret_token_mismatch_reports_unavailable_then_recovers():
             good_secret = f.read()
         assert len(good_secret) == SECRET_TOKEN_LEN
 
-        with open(token_path, "wb") as f:
-            f.write(os.urandom(SECRET_TOKEN_LEN))
-        os.chmod(token_path, 0o600)
+        _write_token_file(token_path, os.urandom(SECRET_TOKEN_LEN))
 
         server = start_server(privdir, env={"XDG_RUNTIME_DIR": runtime_dir})
         resp = do_user_handshake(server, "mismatch", MCP_PROTOCOL_VERSION)
@@ -315,30 +389,22 @@ def test_secret_token_mismatch_reports_unavailable_then_recovers():
         call = _do_tools_call(server, "mismatch-1")
         _assert_broker_unavailable_error(call, "mismatch-1")
 
-        with open(token_path, "wb") as f:
-            f.write(good_secret)
-        os.chmod(token_path, 0o600)
+        _write_token_file(token_path, good_secret)
 
         call = _do_tools_call(server, "mismatch-2")
-        assert call["jsonrpc"] == "2.0"
-        assert call["id"] == "mismatch-2"
+        assert_rpc_response(call, "mismatch-2")
         assert "Unable to reach broker" not in str(call.get("error", {}).get("message", ""))
 
     finally:
-        stop_proc(server)
-        stop_proc(broker)
-        shutil.rmtree(runtime_dir, ignore_errors=True)
-        shutil.rmtree(privdir, ignore_errors=True)
+        stop_procs(server, broker)
+        _cleanup_runtime_dir(runtime_dir)
+        _cleanup_privdir(privdir)
 
 
-def test_unknown_resume_token_fallback_still_starts():
-    privdir = make_temp_privdir("resume-unknown")
+def test_unknown_resume_token_fallback_still_starts(privdir):
     runtime_dir = make_runtime_dir("restok-unknown")
-    broker = None
     server = None
     try:
-        broker = start_broker(privdir)
-
         unknown = os.urandom(RESUME_TOKEN_LEN)
         _seed_resume_token_file(runtime_dir, unknown)
 
@@ -352,20 +418,14 @@ def test_unknown_resume_token_fallback_still_starts():
         assert fresh != unknown
     finally:
         stop_proc(server)
-        stop_proc(broker)
-        shutil.rmtree(runtime_dir, ignore_errors=True)
-        shutil.rmtree(privdir, ignore_errors=True)
+        _cleanup_runtime_dir(runtime_dir)
 
 
-def test_resume_happy_path_across_restart_rotates_token():
-    privdir = make_temp_privdir("resume-rotate")
+def test_resume_happy_path_across_restart_rotates_token(privdir):
     runtime_dir = make_runtime_dir("restok-rotate")
-    broker = None
     server1 = None
     server2 = None
     try:
-        broker = start_broker(privdir)
-
         server1 = start_server(privdir, env={"XDG_RUNTIME_DIR": runtime_dir})
         resp = do_user_handshake(server1, "first", MCP_PROTOCOL_VERSION)
         assert resp["result"]["protocolVersion"] == MCP_PROTOCOL_VERSION
@@ -386,23 +446,17 @@ def test_resume_happy_path_across_restart_rotates_token():
         assert len(token2) == RESUME_TOKEN_LEN
         assert token2 != token1
     finally:
-        stop_proc(server2)
-        stop_proc(server1)
-        stop_proc(broker)
-        shutil.rmtree(runtime_dir, ignore_errors=True)
-        shutil.rmtree(privdir, ignore_errors=True)
+        stop_procs(server2, server1)
+        _cleanup_runtime_dir(runtime_dir)
 
 
-def test_wrong_resume_dir_permissions_disable_resume_but_starts():
-    privdir = make_temp_privdir("resume-perms")
+def test_wrong_resume_dir_permissions_disable_resume_but_starts(privdir):
     runtime_dir = make_runtime_dir("restok-perms")
-    broker = None
     server = None
     try:
         os.makedirs(_resume_store_dir(runtime_dir), mode=0o755, exist_ok=True)
         os.chmod(_resume_store_dir(runtime_dir), 0o755)
 
-        broker = start_broker(privdir)
         server = start_server(privdir, env={"XDG_RUNTIME_DIR": runtime_dir})
         resp = do_user_handshake(server, "perms", MCP_PROTOCOL_VERSION)
         assert resp["result"]["protocolVersion"] == MCP_PROTOCOL_VERSION
@@ -411,9 +465,7 @@ def test_wrong_resume_dir_permissions_disable_resume_but_starts():
         assert _read_resume_token_file(runtime_dir) is None
     finally:
         stop_proc(server)
-        stop_proc(broker)
-        shutil.rmtree(runtime_dir, ignore_errors=True)
-        shutil.rmtree(privdir, ignore_errors=True)
+        _cleanup_runtime_dir(runtime_dir)
 
 
 def test_server_cannot_read_secret_token_reports_unavailable_then_recovers():
@@ -441,20 +493,16 @@ def test_server_cannot_read_secret_token_reports_unavailable_then_recovers():
         call = _do_tools_call(server, "secret-missing-1")
         _assert_broker_unavailable_error(call, "secret-missing-1")
 
-        with open(token_path, "wb") as f:
-            f.write(token)
-        os.chmod(token_path, 0o600)
+        _write_token_file(token_path, token)
 
         call = _do_tools_call(server, "secret-missing-2")
-        assert call["jsonrpc"] == "2.0"
-        assert call["id"] == "secret-missing-2"
+        assert_rpc_response(call, "secret-missing-2")
         assert "Unable to reach broker" not in str(call.get("error", {}).get("message", ""))
 
     finally:
-        stop_proc(server)
-        stop_proc(broker)
-        shutil.rmtree(runtime_dir, ignore_errors=True)
-        shutil.rmtree(privdir, ignore_errors=True)
+        stop_procs(server, broker)
+        _cleanup_runtime_dir(runtime_dir)
+        _cleanup_privdir(privdir)
 
 
 def test_expired_resume_token_fallback_still_starts():
@@ -464,7 +512,9 @@ def test_expired_resume_token_fallback_still_starts():
     server1 = None
     server2 = None
     try:
-        broker = start_broker(privdir, env={"ADBX_TEST_IDLE_TTL_SEC": "1"})
+        broker = start_broker(
+            privdir, env={"ADBX_TEST_IDLE_TTL_SEC": str(TEST_IDLE_TTL_SEC)}
+        )
 
         server1 = start_server(privdir, env={"XDG_RUNTIME_DIR": runtime_dir})
         resp = do_user_handshake(server1, "exp-1", MCP_PROTOCOL_VERSION)
@@ -475,7 +525,10 @@ def test_expired_resume_token_fallback_still_starts():
 
         stop_proc(server1)
         server1 = None
-        time.sleep(2.2)
+        # Expiry is internal broker state, so there is no file or fd event to
+        # wait on. The broker compares whole seconds with a strict '>', so
+        # expiry needs up to TTL + 1s after the session went idle.
+        time.sleep(TEST_IDLE_TTL_SEC + 1 + 0.2)
 
         server2 = start_server(privdir, env={"XDG_RUNTIME_DIR": runtime_dir})
         resp = do_user_handshake(server2, "exp-2", MCP_PROTOCOL_VERSION)
@@ -485,20 +538,15 @@ def test_expired_resume_token_fallback_still_starts():
         assert len(token2) == RESUME_TOKEN_LEN
         assert token2 != token1
     finally:
-        stop_proc(server2)
-        stop_proc(server1)
-        stop_proc(broker)
-        shutil.rmtree(runtime_dir, ignore_errors=True)
-        shutil.rmtree(privdir, ignore_errors=True)
+        stop_procs(server2, server1, broker)
+        _cleanup_runtime_dir(runtime_dir)
+        _cleanup_privdir(privdir)
 
 
-def test_broker_survives_bad_magic_raw_handshake():
-    privdir = make_temp_privdir("raw-bad-magic")
+def test_broker_survives_bad_magic_raw_handshake(privdir):
     runtime_dir = make_runtime_dir("raw-bad-magic-rt")
-    broker = None
     raw = None
     try:
-        broker = start_broker(privdir)
         secret = _read_broker_secret_token(privdir)
         req = _build_handshake_req_bytes(secret, magic=HANDSHAKE_MAGIC ^ 1)
 
@@ -513,18 +561,13 @@ def test_broker_survives_bad_magic_raw_handshake():
     finally:
         if raw is not None:
             raw.close()
-        stop_proc(broker)
-        shutil.rmtree(runtime_dir, ignore_errors=True)
-        shutil.rmtree(privdir, ignore_errors=True)
+        _cleanup_runtime_dir(runtime_dir)
 
 
-def test_broker_survives_len_mismatch_raw_handshake():
-    privdir = make_temp_privdir("raw-len-mismatch")
+def test_broker_survives_len_mismatch_raw_handshake(privdir):
     runtime_dir = make_runtime_dir("raw-len-mismatch-rt")
-    broker = None
     raw = None
     try:
-        broker = start_broker(privdir)
         secret = _read_broker_secret_token(privdir)
         req = _build_handshake_req_bytes(secret)
         short_payload = req[:-1]
@@ -540,18 +583,13 @@ def test_broker_survives_len_mismatch_raw_handshake():
     finally:
         if raw is not None:
             raw.close()
-        stop_proc(broker)
-        shutil.rmtree(runtime_dir, ignore_errors=True)
-        shutil.rmtree(privdir, ignore_errors=True)
+        _cleanup_runtime_dir(runtime_dir)
 
 
-def test_broker_survives_truncated_keep_open_raw_handshake():
-    privdir = make_temp_privdir("raw-truncated")
+def test_broker_survives_truncated_keep_open_raw_handshake(privdir):
     runtime_dir = make_runtime_dir("raw-truncated-rt")
-    broker = None
     raw = None
     try:
-        broker = start_broker(privdir)
         secret = _read_broker_secret_token(privdir)
         req = _build_handshake_req_bytes(secret)
         partial_payload = req[:-2]
@@ -567,18 +605,13 @@ def test_broker_survives_truncated_keep_open_raw_handshake():
     finally:
         if raw is not None:
             raw.close()
-        stop_proc(broker)
-        shutil.rmtree(runtime_dir, ignore_errors=True)
-        shutil.rmtree(privdir, ignore_errors=True)
+        _cleanup_runtime_dir(runtime_dir)
 
 
-def test_broker_survives_no_bytes_raw_handshake():
-    privdir = make_temp_privdir("raw-no-bytes")
+def test_broker_survives_no_bytes_raw_handshake(privdir):
     runtime_dir = make_runtime_dir("raw-no-bytes-rt")
-    broker = None
     raw = None
     try:
-        broker = start_broker(privdir)
         raw = _connect_raw_broker_client(privdir)
         _wait_broker_close(raw)
         raw.close()
@@ -589,23 +622,40 @@ def test_broker_survives_no_bytes_raw_handshake():
     finally:
         if raw is not None:
             raw.close()
-        stop_proc(broker)
-        shutil.rmtree(runtime_dir, ignore_errors=True)
-        shutil.rmtree(privdir, ignore_errors=True)
+        _cleanup_runtime_dir(runtime_dir)
+
+
+# Runs the tests that leave the broker state they depend on untouched against
+# one shared broker. The broker serves one client at a time, so they run
+# sequentially.
+def _run_shared_broker_tests():
+    run_on_shared_broker(
+        "shared-broker",
+        [
+            test_unknown_resume_token_fallback_still_starts,
+            test_resume_happy_path_across_restart_rotates_token,
+            test_wrong_resume_dir_permissions_disable_resume_but_starts,
+            test_broker_survives_bad_magic_raw_handshake,
+            test_broker_survives_len_mismatch_raw_handshake,
+            test_broker_survives_truncated_keep_open_raw_handshake,
+            test_broker_survives_no_bytes_raw_handshake,
+        ],
+    )
 
 
 def main():
-    test_broker_absent_server_reports_unavailable_on_tools_call()
-    test_secret_token_mismatch_reports_unavailable_then_recovers()
-    test_unknown_resume_token_fallback_still_starts()
-    test_resume_happy_path_across_restart_rotates_token()
-    test_wrong_resume_dir_permissions_disable_resume_but_starts()
-    test_server_cannot_read_secret_token_reports_unavailable_then_recovers()
-    test_expired_resume_token_fallback_still_starts()
-    test_broker_survives_bad_magic_raw_handshake()
-    test_broker_survives_len_mismatch_raw_handshake()
-    test_broker_survives_truncated_keep_open_raw_handshake()
-    test_broker_survives_no_bytes_raw_handshake()
+    # Each entry owns its broker (or runs without one) and its temp dirs, so
+    # run_tests may overlap them. The idle-TTL test sleeps the longest and
+    # goes first so the others run while it waits.
+    run_tests(
+        [
+            test_expired_resume_token_fallback_still_starts,
+            test_broker_absent_server_reports_unavailable_on_tools_call,
+            test_secret_token_mismatch_reports_unavailable_then_recovers,
+            test_server_cannot_read_secret_token_reports_unavailable_then_recovers,
+            _run_shared_broker_tests,
+        ]
+    )
     print("OK: test_broker_mcp_handshake")
 
 
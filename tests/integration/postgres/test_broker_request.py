@@ -1,9 +1,9 @@
 #!/usr/bin/env python3
 import shutil
-import struct
 import sys
 
 from test_broker_mcp_handshake import (
+    _HS_HDR,
     _assert_broker_usable,
     _assert_server_usable,
     _build_handshake_req_bytes,
@@ -15,7 +15,13 @@ from test_broker_mcp_handshake import (
     HANDSHAKE_MAGIC,
     HANDSHAKE_VERSION,
 )
-from test_user_mcp_handshake import make_runtime_dir, make_temp_privdir, start_broker, stop_proc
+from test_user_mcp_handshake import (
+    make_runtime_dir,
+    make_temp_privdir,
+    run_tests,
+    start_broker,
+    stop_proc,
+)
 
 HS_OK = 0
 
@@ -29,7 +35,7 @@ def _open_broker_session(privdir):
     payload = _read_len_prefixed(client, timeout_sec=6.0)
     assert len(payload) >= 8
 
-    magic, version, status = struct.unpack(">IHH", payload[:8])
+    magic, version, status = _HS_HDR.unpack_from(payload)
     assert magic == HANDSHAKE_MAGIC
     assert version == HANDSHAKE_VERSION
     assert status == HS_OK
@@ -88,8 +94,13 @@ def test_post_handshake_oversized_request_frame_drops_session():
 
 
 def main():
-    test_post_handshake_truncated_request_frame_drops_session()
-    test_post_handshake_oversized_request_frame_drops_session()
+    # Each test owns its broker and privdir, so run_tests may overlap them.
+    run_tests(
+        [
+            test_post_handshake_truncated_request_frame_drops_session,
+            test_post_handshake_oversized_request_frame_drops_session,
+        ]
+    )
     print("OK: test_broker_request")
 
 
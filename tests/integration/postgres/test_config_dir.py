@@ -8,19 +8,19 @@ import time
 
 from test_user_mcp_handshake import (
     BIN,
+    BUILD_DIR,
     CONFIG,
-    ROOT,
     make_temp_privdir,
     merge_env,
+    run_tests,
     start_broker,
     stop_proc,
 )
 
 
 def _make_tmpdir(prefix):
-    build_dir = os.path.join(ROOT, "build")
-    os.makedirs(build_dir, exist_ok=True)
-    return tempfile.mkdtemp(prefix=f"{prefix}-", dir=build_dir)
+    os.makedirs(BUILD_DIR, exist_ok=True)
+    return tempfile.mkdtemp(prefix=f"{prefix}-", dir=BUILD_DIR)
 
 
 def _wait_for_file(path, timeout_sec=3.0):
@@ -90,9 +90,15 @@ def test_home_fallback_creates_default_config_without_xdg():
 
 
 def main():
-    test_xdg_empty_dir_creates_default_config()
-    test_explicit_config_overrides_xdg_default_path()
-    test_home_fallback_creates_default_config_without_xdg()
+    # Each test owns its broker, privdir and config home, so run_tests may
+    # overlap them.
+    run_tests(
+        [
+            test_xdg_empty_dir_creates_default_config,
+            test_explicit_config_overrides_xdg_default_path,
+            test_home_fallback_creates_default_config_without_xdg,
+        ]
+    )
     print("OK: test_config_dir")
 
 
@@ -1,248 +1,185 @@
 #!/usr/bin/env python3
-import json
 import shutil
 import sys
 
-from test_broker_mcp_handshake import (
-    do_full_handshake,
-)
+from test_broker_mcp_handshake import start_session
 from test_user_mcp_handshake import (
+    MCP_PROTOCOL_VERSION,
+    assert_rpc_response,
+    dumps,
+    loads,
+    make_temp_privdir,
     read_frame,
-    stop_proc,
+    start_broker,
+    stop_procs,
     write_frame,
 )
 
 
-def send_tools_call(server, req_id, connection_name, query):
-    req = {
-        "jsonrpc": "2.0",
-        "id": req_id,
-        "method": "tools/call",
-        "params": {
-            "name": "run_sql_query",
-            "arguments": {
-                "connectionName": connection_name,
-                "query": query,
-            },
-        },
-    }
-    write_frame(server, json.dumps(req).encode("utf-8"))
-    return json.loads(read_frame(server).decode("utf-8"))
-
-
-def test_run_sql_my_db():
-    broker = None
-    server = None
-    privdir = None
-    runtime_dir = None
-    try:
-        broker, server, privdir, runtime_dir, resp = do_full_handshake(req_id=1)
-        assert resp["jsonrpc"] == "2.0"
-
-        resp = send_tools_call(
-            server,
-            "req-3",
-            "MyPostgres",
-            "SELECT z.height_cm FROM zfighters z WHERE z.name = 'Broly'",
-        )
-        assert resp["jsonrpc"] == "2.0"
-        assert resp["id"] == "req-3"
-        data = resp["result"]["structuredContent"]
-        assert data["columns"][0]["name"] == "height_cm"
-        assert data["rows"] == [["220"]]
-    finally:
-        stop_proc(server)
-        stop_proc(broker)
-        if privdir:
-            shutil.rmtree(privdir, ignore_errors=True)
-        if runtime_dir:
-            shutil.rmtree(runtime_dir, ignore_errors=True)
+# Constant JSON around the three per-call values of a run_sql_query request.
+_CALL_HEAD = b'{"jsonrpc":"2.0","id":'
+_CALL_NAME = b',"method":"tools/call","params":{"name":"run_sql_query","arguments":{"connectionName":'
+_CALL_QUERY = b',"query":'
+_CALL_TAIL = b"}}}"
 
 
-def test_run_sql_another_db():
-    broker = None
-    server = None
-    privdir = None
-    runtime_dir = None
-    try:
-        broker, server, privdir, runtime_dir, resp = do_full_handshake(req_id=2)
-        assert resp["jsonrpc"] == "2.0"
-
-        resp = send_tools_call(
-            server,
-            4,
-            "AnotherPostgres",
-            "SELECT g.name FROM gym_exercise g WHERE g.noob_weight = 40",
+def tools_call_payload(req_id, connection_name, query):
+    return b"".join(
+        (
+            _CALL_HEAD,
+            dumps(req_id),
+            _CALL_NAME,
+            dumps(connection_name),
+            _CALL_QUERY,
+            dumps(query),
+            _CALL_TAIL,
         )
-        assert resp["jsonrpc"] == "2.0"
-        assert resp["id"] == 4
-        rows = resp["result"]["structuredContent"]["rows"]
-        names = [row[0] for row in rows]
-        assert "Bench Press" in names
-        assert "Barbell Row" in names
-    finally:
-        stop_proc(server)
-        stop_proc(broker)
-        if privdir:
-            shutil.rmtree(privdir, ignore_errors=True)
-        if runtime_dir:
-            shutil.rmtree(runtime_dir, ignore_errors=True)
+    )
 
 
-def test_run_sql_unknown_table():
-    broker = None
-    server = None
-    privdir = None
-    runtime_dir = None
-    try:
-        broker, server, privdir, runtime_dir, resp = do_full_handshake(req_id=5)
-        assert resp["jsonrpc"] == "2.0"
-
-        resp = send_tools_call(
-            server,
-            51,
-            "AnotherPostgres",
-            "SELECT g.name FROM unknown g WHERE g.noob_weight = 40",
-        )
-        assert resp["jsonrpc"] == "2.0"
-        assert resp["id"] == 51
-        # this should be a tool error
-        assert resp["result"]["isError"] == True
-        assert resp["result"]["content"][0]["type"] == "text"
-        assert resp["result"]["content"][0]["text"] != ""
-    finally:
-        stop_proc(server)
-        stop_proc(broker)
-        if privdir:
-            shutil.rmtree(privdir, ignore_errors=True)
-        if runtime_dir:
-            shutil.rmtree(runtime_dir, ignore_errors=True)
-
-
-def test_run_sql_unknown_db():
-    broker = None
-    server = None
-    privdir = None
-    runtime_dir = None
-    try:
-        broker, server, privdir, runtime_dir, resp = do_full_handshake(req_id=5)
-        assert resp["jsonrpc"] == "2.0"
-
-        resp = send_tools_call(
-            server,
-            6,
-            "Random",
-            "SELECT g.name FROM gym_exercise g WHERE g.noob_weight = 40",
+def send_tools_call(server, req_id, connection_name, query):
+    write_frame(server, tools_call_payload(req_id, connection_name, query))
+    return loads(read_frame(server))
+
+
+# One initialized MCP server reused across tests that don't depend on fresh
+# session state, so they don't each pay for a server spawn and handshake.
+# MCP forbids reusing a request id within a session, so every call made on a
+# session needs an id of its own.
+class McpSession:
+    def __init__(self, privdir, req_id=1, protocol_version=MCP_PROTOCOL_VERSION):
+        self.server, self.runtime_dir, self.init_resp = start_session(
+            privdir, req_id, protocol_version
         )
-        assert resp["jsonrpc"] == "2.0"
-        assert resp["id"] == 6
-        assert "error" in resp
-    finally:
-        stop_proc(server)
-        stop_proc(broker)
-        if privdir:
-            shutil.rmtree(privdir, ignore_errors=True)
-        if runtime_dir:
-            shutil.rmtree(runtime_dir, ignore_errors=True)
 
-
-def test_run_sql_unsafe_role():
-    broker = None
-    server = None
-    privdir = None
-    runtime_dir = None
-    try:
-        broker, server, privdir, runtime_dir, resp = do_full_handshake(req_id=5)
-        assert resp["jsonrpc"] == "2.0"
-
-        resp = send_tools_call(
-            server,
-            6,
-            "SuperPostgres",
-            "SELECT 1;",
-        )
-        assert resp["jsonrpc"] == "2.0"
-        assert resp["id"] == 6
-        assert resp["result"]["isError"] == True
-    finally:
-        stop_proc(server)
-        stop_proc(broker)
-        if privdir:
-            shutil.rmtree(privdir, ignore_errors=True)
-        if runtime_dir:
-            shutil.rmtree(runtime_dir, ignore_errors=True)
+    # Runs one run_sql_query call and returns its decoded response.
+    def call(self, req_id, connection_name, query):
+        return send_tools_call(self.server, req_id, connection_name, query)
+
+    # Removes the runtime dir only; stop self.server with stop_procs, together
+    # with the broker.
+    def close(self):
+        shutil.rmtree(self.runtime_dir, ignore_errors=True)
+
+
+def test_run_sql_my_db(session):
+    resp = session.call(
+        "req-3",
+        "MyPostgres",
+        "SELECT z.height_cm FROM zfighters z WHERE z.name = 'Broly'",
+    )
+    assert_rpc_response(resp, "req-3")
+    data = resp["result"]["structuredContent"]
+    assert data["columns"][0]["name"] == "height_cm"
+    assert data["rows"] == [["220"]]
+
+
+def test_run_sql_another_db(session):
+    resp = session.call(
+        4,
+        "AnotherPostgres",
+        "SELECT g.name FROM gym_exercise g WHERE g.noob_weight = 40",
+    )
+    assert_rpc_response(resp, 4)
+    rows = resp["result"]["structuredContent"]["rows"]
+    names = [row[0] for row in rows]
+    assert "Bench Press" in names
+    assert "Barbell Row" in names
+
+
+def test_run_sql_unknown_table(session):
+    resp = session.call(
+        51,
+        "AnotherPostgres",
+        "SELECT g.name FROM unknown g WHERE g.noob_weight = 40",
+    )
+    assert_rpc_response(resp, 51)
+    # this should be a tool error
+    assert resp["result"]["isError"] == True
+    assert resp["result"]["content"][0]["type"] == "text"
+    assert resp["result"]["content"][0]["text"] != ""
+
+
+def test_run_sql_unknown_db(session):
+    resp = session.call(
+        5,
+        "Random",
+        "SELECT g.name FROM gym_exercise g WHERE g.noob_weight = 40",
+    )
+    assert_rpc_response(resp, 5)
+    assert "error" in resp
+
+
+def test_run_sql_unsafe_role(session):
+    resp = session.call(
+        6,
+        "SuperPostgres",
+        "SELECT 1;",
+    )
+    assert_rpc_response(resp, 6)
+    assert resp["result"]["isError"] == True
+
+
+def test_run_sql_sensitive(session):
+    resp = session.call(
+        7,
+        "AnotherPostgres",
+        "SELECT g.nickname FROM gym_bros g WHERE g.real_name = 'Angelo' LIMIT 1;",
+    )
+    assert_rpc_response(resp, 7)
+    assert resp["result"]["isError"] == True
+    assert "real_name" in resp["result"]["content"][0]["text"]
+
+    resp = session.call(
+        "seven",
+        "AnotherPostgres",
+        "SELECT g.real_name FROM gym_bros g LIMIT 1;",
+    )
+    assert_rpc_response(resp, "seven")
+    assert resp["result"]["structuredContent"]["columns"][0]["name"] == "real_name"
+
+    resp = session.call(
+        8,
+        "AnotherPostgres",
+        "SELECT get_weight(24, 16) AS w;",
+    )
+    assert_rpc_response(resp, 8)
+    row = resp["result"]["structuredContent"]["rows"][0]
+    # libpq can return numeric values as strings; accept both.
+    assert any(str(v) == "40" or str(v) == "40.0" for v in row)
+
+    resp = session.call(
+        9,
+        "AnotherPostgres",
+        "SELECT unsafe_get_weight(20, 10) AS w;",
+    )
+    assert_rpc_response(resp, 9)
+    assert resp["result"]["isError"] == True
+    assert "unsafe_get_weight" in resp["result"]["content"][0]["text"]
 
 
-def test_run_sql_sensitive():
+def main():
+    # Every run_sql_query call is independent server-side, so all tests share
+    # one broker and one initialized MCP session.
+    privdir = make_temp_privdir("run-sql")
     broker = None
-    server = None
-    privdir = None
-    runtime_dir = None
+    session = None
     try:
-        broker, server, privdir, runtime_dir, resp = do_full_handshake(req_id=5)
-        assert resp["jsonrpc"] == "2.0"
-
-        resp = send_tools_call(
-            server,
-            6,
-            "AnotherPostgres",
-            "SELECT g.nickname FROM gym_bros g WHERE g.real_name = 'Angelo' LIMIT 1;",
-        )
-        assert resp["jsonrpc"] == "2.0"
-        assert resp["id"] == 6
-        assert resp["result"]["isError"] == True
-        assert "real_name" in resp["result"]["content"][0]["text"]
-
-        resp = send_tools_call(
-            server,
-            "seven",
-            "AnotherPostgres",
-            "SELECT g.real_name FROM gym_bros g LIMIT 1;",
-        )
-        assert resp["jsonrpc"] == "2.0"
-        assert resp["id"] == "seven"
-        assert resp["result"]["structuredContent"]["columns"][0]["name"] == "real_name"
-
-        resp = send_tools_call(
-            server,
-            8,
-            "AnotherPostgres",
-            "SELECT get_weight(24, 16) AS w;",
-        )
-        assert resp["jsonrpc"] == "2.0"
-        assert resp["id"] == 8
-        row = resp["result"]["structuredContent"]["rows"][0]
-        # libpq can return numeric values as strings; accept both.
-        assert any(str(v) == "40" or str(v) == "40.0" for v in row)
-
-        resp = send_tools_call(
-            server,
-            9,
-            "AnotherPostgres",
-            "SELECT unsafe_get_weight(20, 10) AS w;",
-        )
-        assert resp["jsonrpc"] == "2.0"
-        assert resp["id"] == 9
-        assert resp["result"]["isError"] == True
-        assert "unsafe_get_weight" in resp["result"]["content"][0]["text"]
-
+        broker = start_broker(privdir)
+        session = McpSession(privdir, req_id=1)
+        assert_rpc_response(session.init_resp, 1)
+        test_run_sql_my_db(session)
+        test_run_sql_another_db(session)
+        test_run_sql_unknown_table(session)
+        test_run_sql_unknown_db(session)
+        test_run_sql_unsafe_role(session)
+        test_run_sql_sensitive(session)
+        print("OK: test_mcp_run_sql")
     finally:
-        stop_proc(server)
-        stop_proc(broker)
-        if privdir:
-            shutil.rmtree(privdir, ignore_errors=True)
-        if runtime_dir:
-            shutil.rmtree(runtime_dir, ignore_errors=True)
-
-
-def main():
-    test_run_sql_my_db()
-    test_run_sql_another_db()
-    test_run_sql_unknown_table()
-    test_run_sql_unknown_db()
-    test_run_sql_unsafe_role()
-    test_run_sql_sensitive()
-    print("OK: test_mcp_run_sql")
+        stop_procs(session.server if session is not None else None, broker)
+        if session is not None:
+            session.close()
+        shutil.rmtree(privdir, ignore_errors=True)
 
 
 if __name__ == "__main__":
@@ -1,16 +1,22 @@
 #!/usr/bin/env python3
-import json
 import shutil
 import sys
 
-from test_broker_mcp_handshake import do_full_handshake
+from test_broker_mcp_handshake import start_session
 from test_mcp_run_sql import send_tools_call
-from test_user_mcp_handshake import read_frame, stop_proc, write_frame
+from test_user_mcp_handshake import (
+    assert_rpc_response,
+    dumps,
+    loads,
+    read_frame,
+    run_on_shared_broker,
+    stop_proc,
+    write_frame,
+)
 
 
 def _assert_tools_call_ok(resp, req_id):
-    assert resp["jsonrpc"] == "2.0"
-    assert resp["id"] == req_id
+    assert_rpc_response(resp, req_id)
     assert "result" in resp
     assert resp["result"].get("isError") is not True
     return resp["result"]["structuredContent"]
@@ -30,8 +36,8 @@ def send_tokens_tools_call(server, req_id, connection_name, query, parameters):
             },
         },
     }
-    write_frame(server, json.dumps(req).encode("utf-8"))
-    return json.loads(read_frame(server).decode("utf-8"))
+    write_frame(server, dumps(req))
+    return loads(read_frame(server))
 
 
 def _parse_token(token):
@@ -53,13 +59,11 @@ def _assert_is_token(token, exp_connection):
     assert index >= 0
 
 
-def test_my_postgres_randomized_same_value_yields_different_tokens():
-    broker = None
+def test_my_postgres_randomized_same_value_yields_different_tokens(privdir):
     server = None
-    privdir = None
     runtime_dir = None
     try:
-        broker, server, privdir, runtime_dir, _ = do_full_handshake(req_id=100)
+        server, runtime_dir, _ = start_session(privdir, req_id=100)
 
         q = (
             "SELECT i.scouter_serial "
@@ -80,20 +84,15 @@ def test_my_postgres_randomized_same_value_yields_different_tokens():
         assert tok1 != tok2
     finally:
         stop_proc(server)
-        stop_proc(broker)
-        if privdir:
-            shutil.rmtree(privdir, ignore_errors=True)
         if runtime_dir:
             shutil.rmtree(runtime_dir, ignore_errors=True)
 
 
-def test_my_postgres_only_sensitive_columns_are_tokenized():
-    broker = None
+def test_my_postgres_only_sensitive_columns_are_tokenized(privdir):
     server = None
-    privdir = None
     runtime_dir = None
     try:
-        broker, server, privdir, runtime_dir, _ = do_full_handshake(req_id=110)
+        server, runtime_dir, _ = start_session(privdir, req_id=110)
 
         q = (
             "SELECT i.codename, i.scouter_serial, i.home_coordinates "
@@ -110,20 +109,15 @@ def test_my_postgres_only_sensitive_columns_are_tokenized():
         _assert_is_token(row[2], "MyPostgres")
     finally:
         stop_proc(server)
-        stop_proc(broker)
-        if privdir:
-            shutil.rmtree(privdir, ignore_errors=True)
         if runtime_dir:
             shutil.rmtree(runtime_dir, ignore_errors=True)
 
 
-def test_another_postgres_deterministic_same_value_yields_same_token():
-    broker = None
+def test_another_postgres_deterministic_same_value_yields_same_token(privdir):
     server = None
-    privdir = None
     runtime_dir = None
     try:
-        broker, server, privdir, runtime_dir, _ = do_full_handshake(req_id=120)
+        server, runtime_dir, _ = start_session(privdir, req_id=120)
 
         q = "SELECT g.real_name FROM gym_bros g WHERE g.id = 2 LIMIT 1;"
         resp1 = send_tools_call(server, "another-det-1", "AnotherPostgres", q)
@@ -141,20 +135,15 @@ def test_another_postgres_deterministic_same_value_yields_same_token():
         assert tok1 == tok2
     finally:
         stop_proc(server)
-        stop_proc(broker)
-        if privdir:
-            shutil.rmtree(privdir, ignore_errors=True)
         if runtime_dir:
             shutil.rmtree(runtime_dir, ignore_errors=True)
 
 
-def test_another_postgres_only_sensitive_columns_are_tokenized():
-    broker = None
+def test_another_postgres_only_sensitive_columns_are_tokenized(privdir):
     server = None
-    privdir = None
     runtime_dir = None
     try:
-        broker, server, privdir, runtime_dir, _ = do_full_handshake(req_id=130)
+        server, runtime_dir, _ = start_session(privdir, req_id=130)
 
         q = (
             "SELECT g.nickname, g.real_name "
@@ -169,20 +158,15 @@ def test_another_postgres_only_sensitive_columns_are_tokenized():
         _assert_is_token(row[1], "AnotherPostgres")
     finally:
         stop_proc(server)
-        stop_proc(broker)
-        if privdir:
-            shutil.rmtree(privdir, ignore_errors=True)
         if runtime_dir:
             shutil.rmtree(runtime_dir, ignore_errors=True)
 
 
-def test_my_postgres_run_sql_query_tokens_still_masks_sensitive_output():
-    broker = None
+def test_my_postgres_run_sql_query_tokens_still_masks_sensitive_output(privdir):
     server = None
-    privdir = None
     runtime_dir = None
     try:
-        broker, server, privdir, runtime_dir, _ = do_full_handshake(req_id=140)
+        server, runtime_dir, _ = start_session(privdir, req_id=140)
 
         src = send_tools_call(
             server,
@@ -210,20 +194,15 @@ def test_my_postgres_run_sql_query_tokens_still_masks_sensitive_output():
         _assert_is_token(row[1], "MyPostgres")
     finally:
         stop_proc(server)
-        stop_proc(broker)
-        if privdir:
-            shutil.rmtree(privdir, ignore_errors=True)
         if runtime_dir:
             shutil.rmtree(runtime_dir, ignore_errors=True)
 
 
-def test_another_postgres_run_sql_query_tokens_still_masks_sensitive_output():
-    broker = None
+def test_another_postgres_run_sql_query_tokens_still_masks_sensitive_output(privdir):
     server = None
-    privdir = None
     runtime_dir = None
     try:
-        broker, server, privdir, runtime_dir, _ = do_full_handshake(req_id=150)
+        server, runtime_dir, _ = start_session(privdir, req_id=150)
 
         src = send_tools_call(
             server,
@@ -249,20 +228,22 @@ def test_another_postgres_run_sql_query_tokens_still_masks_sensitive_output():
         _assert_is_token(row[1], "AnotherPostgres")
     finally:
         stop_proc(server)
-        stop_proc(broker)
-        if privdir:
-            shutil.rmtree(privdir, ignore_errors=True)
         if runtime_dir:
             shutil.rmtree(runtime_dir, ignore_errors=True)
 
 
 def main():
-    test_my_postgres_randomized_same_value_yields_different_tokens()
-    test_my_postgres_only_sensitive_columns_are_tokenized()
-    test_another_postgres_deterministic_same_value_yields_same_token()
-    test_another_postgres_only_sensitive_columns_are_tokenized()
-    test_my_postgres_run_sql_query_tokens_still_masks_sensitive_output()
-    test_another_postgres_run_sql_query_tokens_still_masks_sensitive_output()
+    run_on_shared_broker(
+        "token-gen",
+        [
+            test_my_postgres_randomized_same_value_yields_different_tokens,
+            test_my_postgres_only_sensitive_columns_are_tokenized,
+            test_another_postgres_deterministic_same_value_yields_same_token,
+            test_another_postgres_only_sensitive_columns_are_tokenized,
+            test_my_postgres_run_sql_query_tokens_still_masks_sensitive_output,
+            test_another_postgres_run_sql_query_tokens_still_masks_sensitive_output,
+        ],
+    )
     print("OK: test_token_generation")
 
 
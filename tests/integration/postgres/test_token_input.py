@@ -1,11 +1,18 @@
 #!/usr/bin/env python3
-import json
 import shutil
 import sys
 
-from test_broker_mcp_handshake import do_full_handshake
+from test_broker_mcp_handshake import start_session
 from test_mcp_run_sql import send_tools_call
-from test_user_mcp_handshake import read_frame, stop_proc, write_frame
+from test_user_mcp_handshake import (
+    assert_rpc_response,
+    dumps,
+    loads,
+    read_frame,
+    run_on_shared_broker,
+    stop_proc,
+    write_frame,
+)
 
 
 def send_tokens_tools_call(server, req_id, connection_name, query, parameters):
@@ -22,21 +29,19 @@ def send_tokens_tools_call(server, req_id, connection_name, query, parameters):
             },
         },
     }
-    write_frame(server, json.dumps(req).encode("utf-8"))
-    return json.loads(read_frame(server).decode("utf-8"))
+    write_frame(server, dumps(req))
+    return loads(read_frame(server))
 
 
 def _assert_tools_call_ok(resp, req_id):
-    assert resp["jsonrpc"] == "2.0"
-    assert resp["id"] == req_id
+    assert_rpc_response(resp, req_id)
     assert "result" in resp
     assert resp["result"].get("isError") is not True
     return resp["result"]["structuredContent"]
 
 
 def _assert_tools_call_failed(resp, req_id):
-    assert resp["jsonrpc"] == "2.0"
-    assert resp["id"] == req_id
+    assert_rpc_response(resp, req_id)
     if "error" in resp:
         return
     assert "result" in resp
@@ -52,13 +57,11 @@ def _extract_one_token(server, req_id, connection_name, query):
     return tok
 
 
-def test_token_input_happy_path_one_param():
-    broker = None
+def test_token_input_happy_path_one_param(privdir):
     server = None
-    privdir = None
     runtime_dir = None
     try:
-        broker, server, privdir, runtime_dir, _ = do_full_handshake(req_id=200)
+        server, runtime_dir, _ = start_session(privdir, req_id=200)
 
         tok = _extract_one_token(
             server,
@@ -77,20 +80,15 @@ def test_token_input_happy_path_one_param():
         assert data["rows"] == [["1"]]
     finally:
         stop_proc(server)
-        stop_proc(broker)
-        if privdir:
-            shutil.rmtree(privdir, ignore_errors=True)
         if runtime_dir:
             shutil.rmtree(runtime_dir, ignore_errors=True)
 
 
-def test_token_input_happy_path_two_params_from_two_queries():
-    broker = None
+def test_token_input_happy_path_two_params_from_two_queries(privdir):
     server = None
-    privdir = None
     runtime_dir = None
     try:
-        broker, server, privdir, runtime_dir, _ = do_full_handshake(req_id=210)
+        server, runtime_dir, _ = start_session(privdir, req_id=210)
 
         tok_serial = _extract_one_token(
             server,
@@ -117,20 +115,15 @@ def test_token_input_happy_path_two_params_from_two_queries():
         assert data["rows"] == [["Kakarot"]]
     finally:
         stop_proc(server)
-        stop_proc(broker)
-        if privdir:
-            shutil.rmtree(privdir, ignore_errors=True)
         if runtime_dir:
             shutil.rmtree(runtime_dir, ignore_errors=True)
 
 
-def test_token_input_wrong_column_fails():
-    broker = None
+def test_token_input_wrong_column_fails(privdir):
     server = None
-    privdir = None
     runtime_dir = None
     try:
-        broker, server, privdir, runtime_dir, _ = do_full_handshake(req_id=220)
+        server, runtime_dir, _ = start_session(privdir, req_id=220)
 
         tok_home = _extract_one_token(
             server,
@@ -149,20 +142,15 @@ def test_token_input_wrong_column_fails():
         _assert_tools_call_failed(resp, "tok-bad-col-run")
     finally:
         stop_proc(server)
-        stop_proc(broker)
-        if privdir:
-            shutil.rmtree(privdir, ignore_errors=True)
         if runtime_dir:
             shutil.rmtree(runtime_dir, ignore_errors=True)
 
 
-def test_token_input_fewer_tokens_than_params_fails():
-    broker = None
+def test_token_input_fewer_tokens_than_params_fails(privdir):
     server = None
-    privdir = None
     runtime_dir = None
     try:
-        broker, server, privdir, runtime_dir, _ = do_full_handshake(req_id=230)
+        server, runtime_dir, _ = start_session(privdir, req_id=230)
 
         tok_serial = _extract_one_token(
             server,
@@ -182,20 +170,15 @@ def test_token_input_fewer_tokens_than_params_fails():
         _assert_tools_call_failed(resp, "tok-fewer-run")
     finally:
         stop_proc(server)
-        stop_proc(broker)
-        if privdir:
-            shutil.rmtree(privdir, ignore_errors=True)
         if runtime_dir:
             shutil.rmtree(runtime_dir, ignore_errors=True)
 
 
-def test_token_input_more_tokens_than_params_fails():
-    broker = None
+def test_token_input_more_tokens_than_params_fails(privdir):
     server = None
-    privdir = None
     runtime_dir = None
     try:
-        broker, server, privdir, runtime_dir, _ = do_full_handshake(req_id=240)
+        server, runtime_dir, _ = start_session(privdir, req_id=240)
 
         tok_serial = _extract_one_token(
             server,
@@ -220,20 +203,15 @@ def test_token_input_more_tokens_than_params_fails():
         _assert_tools_call_failed(resp, "tok-more-run")
     finally:
         stop_proc(server)
-        stop_proc(broker)
-        if privdir:
-            shutil.rmtree(privdir, ignore_errors=True)
         if runtime_dir:
             shutil.rmtree(runtime_dir, ignore_errors=True)
 
 
-def test_token_input_no_tokens_no_params_fails():
-    broker = None
+def test_token_input_no_tokens_no_params_fails(privdir):
     server = None
-    privdir = None
     runtime_dir = None
     try:
-        broker, server, privdir, runtime_dir, _ = do_full_handshake(req_id=250)
+        server, runtime_dir, _ = start_session(privdir, req_id=250)
 
         resp = send_tokens_tools_call(
             server,
@@ -245,20 +223,15 @@ def test_token_input_no_tokens_no_params_fails():
         _assert_tools_call_failed(resp, "tok-empty-run")
     finally:
         stop_proc(server)
-        stop_proc(broker)
-        if privdir:
-            shutil.rmtree(privdir, ignore_errors=True)
         if runtime_dir:
             shutil.rmtree(runtime_dir, ignore_errors=True)
 
 
-def test_token_input_cross_connection_token_fails():
-    broker = None
+def test_token_input_cross_connection_token_fails(privdir):
     server = None
-    privdir = None
     runtime_dir = None
     try:
-        broker, server, privdir, runtime_dir, _ = do_full_handshake(req_id=260)
+        server, runtime_dir, _ = start_session(privdir, req_id=260)
 
         tok = _extract_one_token(
             server,
@@ -279,21 +252,23 @@ def test_token_input_cross_connection_token_fails():
         assert resp["result"]["isError"] == True
     finally:
         stop_proc(server)
-        stop_proc(broker)
-        if privdir:
-            shutil.rmtree(privdir, ignore_errors=True)
         if runtime_dir:
             shutil.rmtree(runtime_dir, ignore_errors=True)
 
 
 def main():
-    test_token_input_happy_path_one_param()
-    test_token_input_happy_path_two_params_from_two_queries()
-    test_token_input_wrong_column_fails()
-    test_token_input_fewer_tokens_than_params_fails()
-    test_token_input_more_tokens_than_params_fails()
-    test_token_input_no_tokens_no_params_fails()
-    test_token_input_cross_connection_token_fails()
+    run_on_shared_broker(
+        "token-input",
+        [
+            test_token_input_happy_path_one_param,
+            test_token_input_happy_path_two_params_from_two_queries,
+            test_token_input_wrong_column_fails,
+            test_token_input_fewer_tokens_than_params_fails,
+            test_token_input_more_tokens_than_params_fails,
+            test_token_input_no_tokens_no_params_fails,
+            test_token_input_cross_connection_token_fails,
+        ],
+    )
     print("OK: test_token_input")
 
 
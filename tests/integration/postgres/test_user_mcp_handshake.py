@@ -1,17 +1,68 @@
 #!/usr/bin/env python3
-import json
+import atexit
+import ctypes
+import functools
+import itertools
 import os
+import re
+import select
+import shutil
 import subprocess
 import sys
 import tempfile
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Frame payloads go through orjson when it is installed: dumps() yields bytes
+# ready for write_frame and loads() takes read_frame's bytearray as is. The
+# stdlib fallback keeps the harness dependency-free.
+try:
+    import orjson
+
+    def dumps(obj):
+        return orjson.dumps(obj)
+
+    def loads(raw):
+        return orjson.loads(raw)
+
+except ImportError:
+    import json
+
+    def dumps(obj):
+        return json.dumps(obj).encode("utf-8")
+
+    def loads(raw):
+        return json.loads(raw)
+
 
 # root is not '/', but is the root of our repo copied inside the docker
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", ".."))
-BIN = os.path.join(ROOT, "build", "adbxplorer-asan")
-DEFAULT_PRIVDIR = os.path.join(ROOT, "build", "privdir")
+BUILD_DIR = os.path.join(ROOT, "build")
+# ASan build by default. ADBX_TEST_BIN points the harness at another binary,
+# e.g. an unsanitized build for timing runs; it must still be compiled with
+# -DADBX_TEST_MODE since the tests rely on the test-mode timeouts.
+# Spawns no longer chdir to ROOT, so a relative ADBX_TEST_BIN is resolved
+# against ROOT here, once.
+_TEST_BIN = os.environ.get("ADBX_TEST_BIN", os.path.join(BUILD_DIR, "adbxplorer-asan"))
+BIN = os.path.join(ROOT, _TEST_BIN)
+DEFAULT_PRIVDIR = os.path.join(BUILD_DIR, "privdir")
 CONFIG = os.path.join(ROOT, "tests", "integration", "postgres", "config.json")
 MCP_PROTOCOL_VERSION = "2025-11-25"
+# Runtime dirs stand in for XDG_RUNTIME_DIR, which is tmpfs on real systems.
+# Use /dev/shm when available so resume-token IO and teardown stay in RAM;
+# None lets tempfile fall back to its default.
+RUNTIME_TMP_BASE = (
+    "/dev/shm"
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK | os.X_OK)
+    else None
+)
+# How many test callables run_tests() may run at once. Sequential by default
+# so failures stay easy to read; raise it to overlap tests that mostly wait
+# on subprocess startup and sockets.
+IT_JOBS = max(1, int(os.environ.get("ADBX_IT_JOBS", "1")))
+# How long start_broker waits for the broker socket to appear.
+BROKER_START_TIMEOUT_SEC = 2.5
 
 
 def privdir_app_dir(privdir):
@@ -27,9 +78,8 @@ def secret_token_path(privdir):
 
 
 def make_temp_privdir(prefix="mcp-it"):
-    build_dir = os.path.join(ROOT, "build")
-    os.makedirs(build_dir, exist_ok=True)
-    return tempfile.mkdtemp(prefix=f"{prefix}-", dir=build_dir)
+    os.makedirs(BUILD_DIR, exist_ok=True)
+    return tempfile.mkdtemp(prefix=f"{prefix}-", dir=BUILD_DIR)
 
 
 def ensure_privdir_base(privdir):
@@ -37,9 +87,22 @@ def ensure_privdir_base(privdir):
     os.chmod(privdir, 0o700)
 
 
+_runtime_root = None
+_runtime_root_lock = threading.Lock()
+_runtime_seq = itertools.count()
+
+
+# All runtime dirs of this process live under one private root, created on
+# first use and removed at exit. Each call still gets its own 0700 dir; the
+# counter keeps names unique without mkdtemp's random-name retries.
 def make_runtime_dir(prefix="mcp-rt"):
-    path = tempfile.mkdtemp(prefix=f"{prefix}-")
-    os.chmod(path, 0o700)
+    global _runtime_root
+    with _runtime_root_lock:
+        if _runtime_root is None:
+            _runtime_root = tempfile.mkdtemp(prefix="adbx-it-rt-", dir=RUNTIME_TMP_BASE)
+            atexit.register(shutil.rmtree, _runtime_root, ignore_errors=True)
+    path = os.path.join(_runtime_root, f"{prefix}-{next(_runtime_seq)}")
+    os.mkdir(path, 0o700)
     return path
 
 
@@ -54,41 +117,167 @@ def merge_env(extra_env):
     return env
 
 
-def write_frame(proc, payload_bytes):
-    hdr = f"Content-Length: {len(payload_bytes)}\r\n\r\n".encode("ascii")
-    proc.stdin.write(hdr + payload_bytes)
-    proc.stdin.flush()
-
-
-def read_frame(proc):
-    buf = b""
-    while b"\r\n\r\n" not in buf:
-        chunk = proc.stdout.read(1)
+# MCP frame header; only the length varies per frame.
+_HDR_FMT = b"Content-Length: %d\r\n\r\n"
+
+
+# stdin is a 64KiB BufferedWriter, so header and payload leave in one
+# syscall at flush() without being joined here first.
+def write_frame(server, payload_bytes):
+    stdin = server.proc.stdin
+    stdin.write(_HDR_FMT % len(payload_bytes))
+    stdin.write(payload_bytes)
+    stdin.flush()
+
+
+# Send several frames with one pipe write. The server reads stdin as a stream
+# and answers in order, so callers read the responses back one by one.
+def write_frames(server, payloads):
+    parts = []
+    for payload_bytes in payloads:
+        parts.extend((_HDR_FMT % len(payload_bytes), payload_bytes))
+    server.proc.stdin.write(b"".join(parts))
+    server.proc.stdin.flush()
+
+
+# Content-Length must start a header line. Optional blanks around the value
+# mirror what int() used to tolerate.
+_CL_RE = re.compile(rb"(?:^|\r\n)Content-Length:[ \t]*(\d+)[ \t]*\r\n")
+# Longest header we accept, terminator included.
+_MAX_HDR = 260
+# Bytes asked of each os.read(): one full Linux pipe buffer, so a frame that
+# is already in the pipe (even a large result set) arrives in one call.
+_READ_CHUNK = 65536
+# How long read_frame waits for a whole frame before failing the test, so a
+# stuck server shows up as an error instead of a hung run.
+FRAME_READ_TIMEOUT_SEC = 10.0
+
+
+def _wait_readable(fd, deadline):
+    remaining = deadline - time.monotonic()
+    if remaining <= 0 or not select.select([fd], [], [], remaining)[0]:
+        raise RuntimeError("timed out waiting for MCP frame")
+
+
+def read_frame(server):
+    # Read the raw pipe fd directly, bypassing the BufferedReader layer. A
+    # chunk may run past this frame, so leftovers stay in server.buf for the
+    # next call.
+    fd = server.fd
+    buf = server.buf
+    deadline = time.monotonic() + FRAME_READ_TIMEOUT_SEC
+    scanned = 0
+    while True:
+        # Resume a little before the old end: the terminator may straddle
+        # two chunks. Never look past where a valid header could end.
+        idx = buf.find(b"\r\n\r\n", max(0, scanned - 3), _MAX_HDR)
+        if idx != -1:
+            break
+        if len(buf) >= _MAX_HDR:
+            raise RuntimeError("header too large")
+        scanned = len(buf)
+        _wait_readable(fd, deadline)
+        chunk = os.read(fd, _READ_CHUNK)
         if not chunk:
             raise RuntimeError("unexpected EOF while reading header")
         buf += chunk
-        if len(buf) > 256:
-            raise RuntimeError("header too large")
-    hdr, rest = buf.split(b"\r\n\r\n", 1)
-    hdr_text = hdr.decode("ascii", errors="replace")
-    prefix = "Content-Length:"
-    if prefix not in hdr_text:
+    # Search the header only, through the CRLF that ends its last line.
+    m = _CL_RE.search(buf, 0, idx + 2)
+    if m is None:
         raise RuntimeError("missing Content-Length")
-    for line in hdr_text.splitlines():
-        if line.startswith(prefix):
-            n = int(line[len(prefix):].strip())
-            break
-    else:
-        raise RuntimeError("missing Content-Length line")
-    payload = rest
-    while len(payload) < n:
-        chunk = proc.stdout.read(n - len(payload))
-        if not chunk:
+    n = int(m.group(1))
+    # Fill a preallocated payload in place: start with whatever followed the
+    # header in buf, keep any bytes past this frame for the next call.
+    start = idx + 4
+    got = min(n, len(buf) - start)
+    payload = bytearray(n)
+    view = memoryview(payload)
+    view[:got] = buf[start : start + got]
+    del buf[: start + got]
+    while got < n:
+        _wait_readable(fd, deadline)
+        k = os.readv(fd, [view[got:]])
+        if not k:
             raise RuntimeError("unexpected EOF while reading payload")
-        payload += chunk
+        got += k
     return payload
 
 
+# inotify(7) bits, see <sys/inotify.h>.
+_IN_NONBLOCK = os.O_NONBLOCK
+_IN_CLOEXEC = os.O_CLOEXEC
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_libc = None
+
+
+# Returns a non-blocking inotify fd, or None when inotify is not available.
+def _inotify_init():
+    global _libc
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        if _libc is None:
+            _libc = ctypes.CDLL(None, use_errno=True)
+        fd = _libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+    except (OSError, AttributeError):
+        return None
+    return fd if fd >= 0 else None
+
+
+# Waits until path exists, failing early if proc exits. The broker creates
+# its run dir and socket itself, so we watch the deepest existing ancestor for
+# IN_CREATE and move the watch down as directories appear. Returns False on
+# timeout. Falls back to polling with backoff when inotify is not available.
+def _wait_for_path(path, proc, timeout_sec):
+    deadline = time.monotonic() + timeout_sec
+    fd = _inotify_init()
+    backoff = 0.001
+    try:
+        watched = None
+        while True:
+            if proc.poll() is not None:
+                raise RuntimeError("broker exited before creating socket")
+            if fd is not None:
+                parent = os.path.dirname(path)
+                while not os.path.isdir(parent):
+                    parent = os.path.dirname(parent)
+                # Add the watch before checking for path so a creation in
+                # between is not missed.
+                if parent != watched:
+                    wd = _libc.inotify_add_watch(
+                        fd, os.fsencode(parent), _IN_CREATE | _IN_MOVED_TO
+                    )
+                    if wd < 0:
+                        os.close(fd)
+                        fd = None
+                    else:
+                        watched = parent
+            if os.path.exists(path):
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            if fd is None:
+                # Start with short sleeps so a fast broker is seen within a
+                # millisecond or two, then back off to the old 50ms period.
+                time.sleep(min(remaining, backoff))
+                backoff = min(backoff * 2, 0.05)
+                continue
+            # Process exit raises no inotify event; cap the wait so the
+            # liveness check above still runs regularly.
+            ready, _, _ = select.select([fd], [], [], min(remaining, 0.1))
+            if ready:
+                try:
+                    while os.read(fd, 4096):
+                        pass
+                except BlockingIOError:
+                    pass
+    finally:
+        if fd is not None:
+            os.close(fd)
+
+
 def start_broker(privdir=DEFAULT_PRIVDIR, env=None, config_path=None):
     ensure_privdir_base(privdir)
     sock = broker_sock_path(privdir)
@@ -102,67 +291,155 @@ def start_broker(privdir=DEFAULT_PRIVDIR, env=None, config_path=None):
 
     proc = subprocess.Popen(
         cmd,
-        cwd=ROOT,
         stdout=subprocess.DEVNULL,
         # Forward broker logs to the test runner so failures aren't silent.
         stderr=None,
         env=proc_env,
     )
 
-    for _ in range(50):
-        if proc.poll() is not None:
-            raise RuntimeError("broker exited before creating socket")
-        if os.path.exists(sock):
-            return proc
-        time.sleep(0.05)
+    if _wait_for_path(sock, proc, BROKER_START_TIMEOUT_SEC):
+        return proc
 
     stop_proc(proc)
     raise RuntimeError("broker did not create socket")
 
 
+# A running MCP server. read_frame reads 'fd' (the server's stdout) directly;
+# 'buf' holds bytes it read ahead but has not returned yet, so nothing else
+# may read proc.stdout.
+class McpServer:
+    def __init__(self, proc):
+        self.proc = proc
+        self.fd = proc.stdout.fileno()
+        self.buf = bytearray()
+
+
 def start_server(privdir=DEFAULT_PRIVDIR, env=None):
-    return subprocess.Popen(
+    proc = subprocess.Popen(
         [BIN, "-privdir", privdir],
-        cwd=ROOT,
+        # Explicit stdin buffer size instead of relying on the default;
+        # write_frame flushes each frame as one write anyway.
+        bufsize=65536,
         stdin=subprocess.PIPE,
         stdout=subprocess.PIPE,
         # Forward MCP server logs to the test runner for easier debugging.
         stderr=None,
         env=merge_env(env),
     )
+    return McpServer(proc)
 
 
+# MCP servers exit cleanly on stdin EOF, so close stdin first and give them a
+# moment; SIGTERM (then SIGKILL) is the fallback, and the only path for the
+# broker, which has no stdin pipe.
 def stop_proc(proc):
-    if proc is None:
+    stop_procs(proc)
+
+
+# Like stop_proc for several processes at once: every process is told to stop
+# before any wait starts, so a teardown costs the slowest child, not the sum.
+# Takes broker Popens and McpServers; None entries are skipped.
+def stop_procs(*procs):
+    procs = [
+        proc.proc if isinstance(proc, McpServer) else proc
+        for proc in procs
+        if proc is not None
+    ]
+    graceful = []
+    for proc in procs:
+        if proc.stdin is not None and not proc.stdin.closed:
+            try:
+                proc.stdin.close()
+                graceful.append(proc)
+                continue
+            except Exception:
+                pass
+        proc.terminate()
+    deadline = time.monotonic() + 0.5
+    for proc in graceful:
+        try:
+            proc.wait(timeout=max(0.0, deadline - time.monotonic()))
+        except Exception:
+            proc.terminate()
+    # All SIGTERMs are out; the 2s allowance is shared, not per process.
+    deadline = time.monotonic() + 2
+    for proc in procs:
+        try:
+            proc.wait(timeout=max(0.0, deadline - time.monotonic()))
+        except Exception:
+            proc.kill()
+            # Reap right away so no zombie outlives the test.
+            proc.wait()
+
+
+# Runs each callable in 'tests'. Callables must not share a broker: the broker
+# serves one client at a time. With IT_JOBS > 1 they run on a thread pool and
+# the first failure (in list order) is re-raised after all of them finish.
+def run_tests(tests):
+    if IT_JOBS <= 1:
+        for test in tests:
+            test()
         return
+    with ThreadPoolExecutor(max_workers=IT_JOBS) as ex:
+        futures = [ex.submit(test) for test in tests]
+    for fut in futures:
+        fut.result()
+
+
+# Runs each test in 'tests' against one broker on a fresh privdir, passing the
+# privdir. Each test starts its own MCP server and runtime dir, so sessions
+# stay independent. The broker takes one client at a time, hence the
+# sequential run.
+def run_on_shared_broker(prefix, tests):
+    privdir = make_temp_privdir(prefix)
+    broker = None
     try:
-        proc.terminate()
-        proc.wait(timeout=2)
-    except Exception:
-        proc.kill()
+        broker = start_broker(privdir)
+        for test in tests:
+            test(privdir)
+    finally:
+        stop_proc(broker)
+        shutil.rmtree(privdir, ignore_errors=True)
+
+
+# Checks the JSON-RPC envelope every response must carry.
+def assert_rpc_response(resp, req_id):
+    assert resp["jsonrpc"] == "2.0"
+    assert resp["id"] == req_id
+
+
+# Only id and protocolVersion vary between initialize requests, so the rest
+# of the JSON is a constant bytes template with two %b slots.
+_INIT_TMPL = (
+    b'{"jsonrpc":"2.0","id":%b,"method":"initialize",'
+    b'"params":{"protocolVersion":%b,"capabilities":{"elicitation":{}},'
+    b'"clientInfo":{"name":"example-client","version":"1.0.0"}}}'
+)
+
+
+def initialize_payload(req_id, protocol_version):
+    return _INIT_TMPL % (dumps(req_id), dumps(protocol_version))
 
 
 def do_user_handshake(server, req_id, protocol_version):
-    req = {
-        "jsonrpc": "2.0",
-        "id": req_id,
-        "method": "initialize",
-        "params": {
-            "protocolVersion": protocol_version,
-            "capabilities": {"elicitation": {}},
-            "clientInfo": {"name": "example-client", "version": "1.0.0"},
-        },
-    }
-    write_frame(server, json.dumps(req).encode("utf-8"))
-    return json.loads(read_frame(server).decode("utf-8"))
-
-
-def test_handshake_ok():
-    server = start_server()
+    write_frame(server, initialize_payload(req_id, protocol_version))
+    return loads(read_frame(server))
+
+
+def test_handshake_ok(privdir=DEFAULT_PRIVDIR, server_env=None):
+    server = start_server(privdir, env=server_env)
     try:
-        resp = do_user_handshake(server, 1, MCP_PROTOCOL_VERSION)
-        assert resp["jsonrpc"] == "2.0"
-        assert resp["id"] == 1
+        # Both initialize requests go out in one write; the server answers
+        # them in order.
+        write_frames(
+            server,
+            [
+                initialize_payload(1, MCP_PROTOCOL_VERSION),
+                initialize_payload("second", MCP_PROTOCOL_VERSION),
+            ],
+        )
+        resp = loads(read_frame(server))
+        assert_rpc_response(resp, 1)
         assert resp["result"]["protocolVersion"] == MCP_PROTOCOL_VERSION
         assert "tools" in resp["result"]["capabilities"]
         assert "resources" in resp["result"]["capabilities"]
@@ -170,9 +447,8 @@ def test_handshake_ok():
         assert resp["result"]["serverInfo"]["version"] == "0.0.1"
 
         # Double initialize should fail.
-        resp = do_user_handshake(server, "second", MCP_PROTOCOL_VERSION)
-        assert resp["jsonrpc"] == "2.0"
-        assert resp["id"] == "second"
+        resp = loads(read_frame(server))
+        assert_rpc_response(resp, "second")
         assert "error" in resp
     finally:
         stop_proc(server)
@@ -180,24 +456,23 @@ def test_handshake_ok():
 
 # This should not error: when client asks for an unsupported version, the
 # server replies with a supported one.
-def test_handshake_bad_version():
-    server = start_server()
+def test_handshake_bad_version(privdir=DEFAULT_PRIVDIR, server_env=None):
+    server = start_server(privdir, env=server_env)
     try:
         resp = do_user_handshake(server, 2, "2020-01-01")
-        assert resp["jsonrpc"] == "2.0"
-        assert resp["id"] == 2
+        assert_rpc_response(resp, 2)
         assert resp["result"]["protocolVersion"] == MCP_PROTOCOL_VERSION
     finally:
         stop_proc(server)
 
 
 # Invalid JSON should return JSON-RPC Invalid Request.
-def test_handshake_invalid_json():
-    server = start_server()
+def test_handshake_invalid_json(privdir=DEFAULT_PRIVDIR, server_env=None):
+    server = start_server(privdir, env=server_env)
     try:
         bad = b'{"jsonrpc":"2.0","id":3,"method":"initialize"'
         write_frame(server, bad)
-        resp = json.loads(read_frame(server).decode("utf-8"))
+        resp = loads(read_frame(server))
         assert resp["jsonrpc"] == "2.0"
         assert resp["id"] is None
         assert resp["error"]["code"] == -32600
@@ -205,8 +480,8 @@ def test_handshake_invalid_json():
         stop_proc(server)
 
 
-def test_notification_invalid_request():
-    server = start_server()
+def test_notification_invalid_request(privdir=DEFAULT_PRIVDIR, server_env=None):
+    server = start_server(privdir, env=server_env)
     try:
         resp = do_user_handshake(server, 4, MCP_PROTOCOL_VERSION)
         assert resp["jsonrpc"] == "2.0"
@@ -217,26 +492,50 @@ def test_notification_invalid_request():
             "method": "notifications/test",
             "params": {"x": 1},
         }
-        write_frame(server, json.dumps(note).encode("utf-8"))
-
         # Verify connection still alive by issuing initialize again.
-        resp = do_user_handshake(server, 5, MCP_PROTOCOL_VERSION)
-        assert resp["jsonrpc"] == "2.0"
-        assert resp["id"] == 5
+        write_frames(server, [dumps(note), initialize_payload(5, MCP_PROTOCOL_VERSION)])
+        resp = loads(read_frame(server))
+        assert_rpc_response(resp, 5)
     finally:
         stop_proc(server)
 
 
-def main():
-    broker = start_broker()
+# Runs 'test' against a broker of its own on a fresh privdir. A server needs
+# the broker for every request and the broker takes one client at a time, so
+# this is what lets the handshake tests overlap. Each test also gets its own
+# XDG_RUNTIME_DIR: concurrent servers share our pid as parent, so they would
+# otherwise share a resume-token file across different brokers.
+def _run_with_own_broker(test):
+    privdir = make_temp_privdir("user-hs")
+    runtime_dir = make_runtime_dir("user-hs")
+    broker = None
     try:
-        test_handshake_ok()
-        test_handshake_bad_version()
-        test_handshake_invalid_json()
-        test_notification_invalid_request()
-        print("OK: test_user_mcp_handshake")
+        broker = start_broker(privdir)
+        test(privdir, {"XDG_RUNTIME_DIR": runtime_dir})
     finally:
         stop_proc(broker)
+        shutil.rmtree(runtime_dir, ignore_errors=True)
+        shutil.rmtree(privdir, ignore_errors=True)
+
+
+def main():
+    tests = [
+        test_handshake_ok,
+        test_handshake_bad_version,
+        test_handshake_invalid_json,
+        test_notification_invalid_request,
+    ]
+    if IT_JOBS > 1:
+        run_tests([functools.partial(_run_with_own_broker, test) for test in tests])
+    else:
+        # Sequential: one broker serves all of them.
+        broker = start_broker()
+        try:
+            for test in tests:
+                test()
+        finally:
+            stop_proc(broker)
+    print("OK: test_user_mcp_handshake")
 
 
 if __name__ == "__main__":